@@ -5,7 +5,7 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
@@ -21,12 +21,39 @@ db = None
 database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
-if database_url and database_name:
-    _client = MongoClient(database_url)
-    db = _client[database_name]
+# Connection pool and timeout settings for the shared client. Short timeouts make
+# requests fail fast when Mongo is unreachable instead of queueing behind it.
+client_options = {
+    "maxPoolSize": int(os.getenv("MONGO_POOL", "200")),
+    "minPoolSize": 10,
+    "serverSelectionTimeoutMS": 2000,
+    "socketTimeoutMS": 5000,
+    "compressors": os.getenv("MONGO_COMPRESSORS", "zstd,zlib"),
+    # Return stored datetimes as aware UTC, matching what the app writes
+    "tz_aware": True,
+}
+
+
+def connect():
+    """Create the shared Motor client (call once from the app's startup hook)"""
+    global _client, db
+    if _client is None and database_url and database_name:
+        _client = AsyncIOMotorClient(database_url, **client_options)
+        db = _client[database_name]
+    return db
+
+
+def close():
+    """Close the shared Motor client (call from the app's shutdown hook)"""
+    global _client, db
+    if _client is not None:
+        _client.close()
+    _client = None
+    db = None
+
 
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
+async def create_document(collection_name: str, data: Union[BaseModel, dict]):
     """Insert a single document with timestamp"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
@@ -37,19 +64,24 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     else:
         data_dict = data.copy()
 
-    data_dict['created_at'] = datetime.now(timezone.utc)
-    data_dict['updated_at'] = datetime.now(timezone.utc)
+    now = datetime.now(timezone.utc)
+    data_dict['created_at'] = now
+    data_dict['updated_at'] = now
 
-    result = db[collection_name].insert_one(data_dict)
+    result = await db[collection_name].insert_one(data_dict)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
-    """Get documents from collection"""
+async def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None,
+                        projection: dict = None, sort: Union[str, list] = None):
+    """Get documents from collection, optionally projected and sorted"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
     
-    cursor = db[collection_name].find(filter_dict or {})
+    cursor = db[collection_name].find(filter_dict or {}, projection)
+    if sort:
+        cursor = cursor.sort(sort)
     if limit:
         cursor = cursor.limit(limit)
     
-    return list(cursor)
+    # .limit() bounds the cursor; Motor rejects a negative to_list length
+    return await cursor.to_list(length=None)
@@ -1,33 +1,119 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
 import os
-from datetime import datetime, timedelta
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
 from typing import Optional, List
 
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, EmailStr
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, field_validator
+
+import anyio
+from cachetools import TTLCache
+import bcrypt
+import jwt
+import orjson
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+import database
+from database import create_document, get_documents
+from schemas import User, Blogpost, Contactmessage
+
+logger = logging.getLogger(__name__)
+
+# Lifecycle
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_TOKENS
+    # forkserver: forking this process once Motor/anyio threads exist can deadlock the child
+    app.state.bcrypt_pool = ProcessPoolExecutor(
+        max_workers=BCRYPT_WORKERS,
+        mp_context=multiprocessing.get_context("forkserver"),
+    )
+    db = database.connect()
+    if db is not None:
+        await ensure_email_index(db)
+        try:
+            await db["blogpost"].create_index("slug", unique=True)
+            await db["blogpost"].create_index([("published", 1), ("published_at", -1)])
+        except Exception as e:
+            logger.error("Unable to create blogpost indexes: %s", e)
+        try:
+            await seed_blogposts(db)
+        except Exception as e:
+            logger.warning("Unable to seed blog posts: %s", e)
+
+    yield
+
+    database.close()
+    app.state.bcrypt_pool.shutdown()
 
-from passlib.context import CryptContext
-from jose import jwt
-
-from database import db, create_document, get_documents
 
 # App setup
-app = FastAPI(title="SaaS Starter API")
+app = FastAPI(title="SaaS Starter API", default_response_class=ORJSONResponse, lifespan=lifespan)
+
+# Comma-separated list of origins allowed to call the API with credentials
+FRONTEND_ORIGINS = [
+    origin.strip()
+    for origin in os.getenv("FRONTEND_ORIGIN", "https://app.example.com").split(",")
+    if origin.strip()
+]
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=FRONTEND_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["authorization", "content-type"],
 )
 
 # Security settings
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = 12
 JWT_SECRET = os.getenv("JWT_SECRET", "supersecretkey")
+JWT_KEY = JWT_SECRET.encode()
 JWT_ALG = "HS256"
 JWT_EXPIRES_MIN = 60 * 24 * 7  # 7 days
 
+# Recently verified credentials, keyed by (email, sha256(password), password_hash).
+# Only successes are stored: caching failures would make repeat guesses against real
+# accounts faster than against unknown emails, which always pay for DUMMY_HASH.
+VERIFY_CACHE_TTL = 60
+_verify_cache = TTLCache(maxsize=10_000, ttl=VERIFY_CACHE_TTL)
+
+# Encoded blog listing responses, keyed by limit
+BLOG_CACHE_TTL = 60
+_blog_cache = TTLCache(maxsize=32, ttl=BLOG_CACHE_TTL)
+
+# Unique user.email index state; register falls back to a find_one check until it exists
+EMAIL_INDEX_RETRY_SECONDS = 60
+_email_index = {"ready": False, "retry_at": 0.0}
+
+# Collection names reported by /test?verbose=1
+COLLECTIONS_CACHE_TTL = 5
+_collections_cache = TTLCache(maxsize=1, ttl=COLLECTIONS_CACHE_TTL)
+
+# JSON schemas are fixed for the process lifetime, so generate and encode them once
+SCHEMA_JSON = orjson.dumps({
+    "user": User.model_json_schema(),
+    "blogpost": Blogpost.model_json_schema(),
+    "contactmessage": Contactmessage.model_json_schema(),
+})
+
+# bcrypt processes per uvicorn worker; by default the cores are split across WEB_CONCURRENCY workers
+BCRYPT_WORKERS = int(os.getenv(
+    "BCRYPT_WORKERS",
+    max(1, (os.cpu_count() or 1) // int(os.getenv("WEB_CONCURRENCY", "1"))),
+))
+
+# Worker threads left for residual sync work (anyio defaults to 40)
+THREADPOOL_TOKENS = 200
+
 
 # Request/Response models
 class RegisterRequest(BaseModel):
@@ -49,44 +135,180 @@ class ContactRequest(BaseModel):
     meta: Optional[dict] = None
 
 
-class BlogItem(BaseModel):
+class DocumentOut(BaseModel):
+    """Base for responses built from Mongo documents; serializes the ObjectId as `_id`"""
+    model_config = ConfigDict(populate_by_name=True)
+
+    id: str = Field(alias="_id")
+
+    @field_validator("id", mode="before")
+    @classmethod
+    def _oid(cls, v):
+        return str(v)
+
+
+class UserOut(DocumentOut):
+    name: str
+    email: EmailStr
+    avatar_url: Optional[str] = None
+    plan: str = "free"
+    is_active: bool = True
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
+class AuthResponse(BaseModel):
+    token: str
+    user: UserOut
+
+
+class BlogItem(DocumentOut):
     title: str
     slug: str
     excerpt: Optional[str] = None
-    content: str
     author: str
     tags: List[str] = []
     published: bool = True
     published_at: Optional[datetime] = None
     cover_image: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
+class BlogListResponse(BaseModel):
+    items: List[BlogItem]
 
 
 # Helpers
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode()
 
 
 def verify_password(password: str, hashed: str) -> bool:
-    return pwd_context.verify(password, hashed)
+    try:
+        return bcrypt.checkpw(password.encode(), hashed.encode())
+    except ValueError:
+        # Missing or malformed stored hash
+        return False
+
+
+# Verified against when the email is unknown, so both login paths pay the same bcrypt cost
+DUMMY_HASH = hash_password("x")
+
 
+async def run_in_bcrypt_pool(func, *args):
+    """Run a CPU-bound hashing helper in the process pool, off the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(app.state.bcrypt_pool, func, *args)
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
+
+async def check_password(email: str, password: str, hashed: str) -> bool:
+    """Verify a password, skipping bcrypt if the same credentials recently verified"""
+    key = (email, hashlib.sha256(password.encode()).hexdigest(), hashed)
+    if key in _verify_cache:
+        return True
+    result = await run_in_bcrypt_pool(verify_password, password, hashed)
+    if result:
+        _verify_cache[key] = True
+    return result
+
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None, now: Optional[datetime] = None) -> str:
     to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=JWT_EXPIRES_MIN))
+    expire = (now or datetime.now(timezone.utc)) + (expires_delta or timedelta(minutes=JWT_EXPIRES_MIN))
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALG)
+    encoded_jwt = jwt.encode(to_encode, JWT_KEY, algorithm=JWT_ALG)
     return encoded_jwt
 
 
+async def ensure_email_index(db) -> bool:
+    """Create the unique user.email index, retrying at most every EMAIL_INDEX_RETRY_SECONDS"""
+    if _email_index["ready"]:
+        return True
+    if time.monotonic() < _email_index["retry_at"]:
+        return False
+    _email_index["retry_at"] = time.monotonic() + EMAIL_INDEX_RETRY_SECONDS
+    try:
+        await db["user"].create_index("email", unique=True)
+    except OperationFailure as e:
+        if e.code == 11000:
+            logger.error(
+                "Unable to create unique index on user.email: the user collection contains "
+                "duplicate emails. Remove the duplicates; the index is retried every %ss. %s",
+                EMAIL_INDEX_RETRY_SECONDS, e,
+            )
+        else:
+            logger.error("Unable to create unique index on user.email: %s", e)
+        return False
+    except Exception as e:
+        logger.error("Unable to create unique index on user.email, will retry: %s", e)
+        return False
+    _email_index["ready"] = True
+    return True
+
+
+async def seed_blogposts(db):
+    """Insert a few demo posts when the blogpost collection is empty"""
+    if await db["blogpost"].estimated_document_count() > 0:
+        return
+    now = datetime.now(timezone.utc)
+    seed_posts = [
+        {
+            "title": "Designing Trust in Fintech",
+            "slug": "designing-trust-in-fintech",
+            "excerpt": "How micro-interactions and clear copy build confidence in digital banking.",
+            "content": "Long form content...",
+            "author": "Team",
+            "tags": ["design", "fintech"],
+            "published": True,
+            "published_at": now,
+            "cover_image": None,
+            "created_at": now,
+            "updated_at": now,
+        },
+        {
+            "title": "Pricing Psychology 101",
+            "slug": "pricing-psychology-101",
+            "excerpt": "Make tiers that guide choices without pressure.",
+            "content": "Long form content...",
+            "author": "Team",
+            "tags": ["pricing", "growth"],
+            "published": True,
+            "published_at": now,
+            "cover_image": None,
+            "created_at": now,
+            "updated_at": now,
+        },
+        {
+            "title": "Your First 100 Users",
+            "slug": "your-first-100-users",
+            "excerpt": "Practical channels to get traction for your SaaS.",
+            "content": "Long form content...",
+            "author": "Team",
+            "tags": ["growth"],
+            "published": True,
+            "published_at": now,
+            "cover_image": None,
+            "created_at": now,
+            "updated_at": now,
+        },
+    ]
+    try:
+        await db["blogpost"].insert_many(seed_posts, ordered=False, bypass_document_validation=True)
+    except (BulkWriteError, DuplicateKeyError):
+        # Another worker seeded concurrently; the unique slug index rejected only the copies
+        pass
+
+
 # Routes
 @app.get("/")
-def root():
+async def root():
     return {"message": "SaaS Starter Backend Running"}
 
 
 @app.get("/test")
-def test_database():
+async def test_database(verbose: bool = False):
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -96,11 +318,17 @@ def test_database():
         "collections": []
     }
     try:
-        if db is not None:
+        if database.db is not None:
             response["database"] = "✅ Available"
             response["connection_status"] = "Connected"
             try:
-                response["collections"] = db.list_collection_names()[:10]
+                await database.db.command("ping")
+                if verbose:
+                    collections = _collections_cache.get("names")
+                    if collections is None:
+                        collections = (await database.db.list_collection_names())[:10]
+                        _collections_cache["names"] = collections
+                    response["collections"] = collections
                 response["database"] = "✅ Connected & Working"
             except Exception as e:
                 response["database"] = f"⚠️ Connected but Error: {str(e)[:80]}"
@@ -112,136 +340,104 @@ def test_database():
 
 
 # Auth endpoints
-@app.post("/api/auth/register")
-def register(payload: RegisterRequest):
-    if db is None:
+@app.post("/api/auth/register", response_model=AuthResponse)
+async def register(payload: RegisterRequest):
+    if database.db is None:
         raise HTTPException(status_code=500, detail="Database not available")
 
-    existing = db["user"].find_one({"email": payload.email})
-    if existing:
-        raise HTTPException(status_code=400, detail="Email already registered")
+    if not await ensure_email_index(database.db):
+        # Without the unique index, duplicates have to be caught before inserting
+        existing = await database.db["user"].find_one({"email": payload.email}, {"_id": 1})
+        if existing:
+            raise HTTPException(status_code=400, detail="Email already registered")
 
+    now = datetime.now(timezone.utc)
     user_doc = {
         "name": payload.name,
         "email": payload.email,
-        "password_hash": hash_password(payload.password),
+        "password_hash": await run_in_bcrypt_pool(hash_password, payload.password),
         "avatar_url": None,
         "plan": "free",
         "is_active": True,
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow(),
+        "created_at": now,
+        "updated_at": now,
     }
-    res = db["user"].insert_one(user_doc)
-    token = create_access_token({"sub": str(res.inserted_id), "email": payload.email})
-    user_doc.pop("password_hash", None)
-    user_doc["_id"] = str(res.inserted_id)
+    try:
+        res = await database.db["user"].insert_one(user_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    token = create_access_token({"sub": str(res.inserted_id), "email": payload.email}, now=now)
     return {"token": token, "user": user_doc}
 
 
-@app.post("/api/auth/login")
-def login(payload: LoginRequest):
-    if db is None:
+@app.post("/api/auth/login", response_model=AuthResponse)
+async def login(payload: LoginRequest):
+    if database.db is None:
         raise HTTPException(status_code=500, detail="Database not available")
 
-    user = db["user"].find_one({"email": payload.email})
+    user = await database.db["user"].find_one({"email": payload.email})
     if not user:
+        await run_in_bcrypt_pool(verify_password, payload.password, DUMMY_HASH)
         raise HTTPException(status_code=400, detail="Invalid credentials")
-    if not verify_password(payload.password, user.get("password_hash", "")):
+    if not await check_password(payload.email, payload.password, user.get("password_hash", "")):
         raise HTTPException(status_code=400, detail="Invalid credentials")
 
     token = create_access_token({"sub": str(user.get("_id")), "email": user.get("email")})
-    user["_id"] = str(user["_id"])
-    user.pop("password_hash", None)
     return {"token": token, "user": user}
 
 
 # Blog endpoints
-@app.get("/api/blogs")
-def list_blogs(limit: int = 6):
-    if db is None:
+@app.get("/api/blogs", response_model=BlogListResponse)
+async def list_blogs(limit: int = 6):
+    if database.db is None:
         raise HTTPException(status_code=500, detail="Database not available")
 
-    # Seed a few demo posts if empty
-    count = db["blogpost"].count_documents({})
-    if count == 0:
-        seed_posts = [
-            {
-                "title": "Designing Trust in Fintech",
-                "slug": "designing-trust-in-fintech",
-                "excerpt": "How micro-interactions and clear copy build confidence in digital banking.",
-                "content": "Long form content...",
-                "author": "Team",
-                "tags": ["design", "fintech"],
-                "published": True,
-                "published_at": datetime.utcnow(),
-                "cover_image": None,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow(),
-            },
-            {
-                "title": "Pricing Psychology 101",
-                "slug": "pricing-psychology-101",
-                "excerpt": "Make tiers that guide choices without pressure.",
-                "content": "Long form content...",
-                "author": "Team",
-                "tags": ["pricing", "growth"],
-                "published": True,
-                "published_at": datetime.utcnow(),
-                "cover_image": None,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow(),
-            },
-            {
-                "title": "Your First 100 Users",
-                "slug": "your-first-100-users",
-                "excerpt": "Practical channels to get traction for your SaaS.",
-                "content": "Long form content...",
-                "author": "Team",
-                "tags": ["growth"],
-                "published": True,
-                "published_at": datetime.utcnow(),
-                "cover_image": None,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow(),
-            },
-        ]
-        if seed_posts:
-            db["blogpost"].insert_many(seed_posts)
-
-    docs = get_documents("blogpost", {"published": True}, limit)
-    # Convert ObjectId
-    for d in docs:
-        d["_id"] = str(d.get("_id"))
-    return {"items": docs}
+    body = _blog_cache.get(limit)
+    if body is not None:
+        return Response(content=body, media_type="application/json")
+
+    docs = await get_documents(
+        "blogpost",
+        {"published": True},
+        limit,
+        projection={"content": 0},
+        sort=[("published_at", -1)],
+    )
+    # Validate and encode once; cache hits return the bytes without re-serializing
+    body = BlogListResponse.model_validate({"items": docs}).model_dump_json(by_alias=True).encode()
+    _blog_cache[limit] = body
+    return Response(content=body, media_type="application/json")
 
 
 # Contact endpoint
 @app.post("/api/contact")
-def contact(payload: ContactRequest):
-    if db is None:
+async def contact(payload: ContactRequest):
+    if database.db is None:
         raise HTTPException(status_code=500, detail="Database not available")
+    # create_document stamps created_at/updated_at
     doc = payload.dict()
-    doc["created_at"] = datetime.utcnow()
-    doc["updated_at"] = datetime.utcnow()
-    res_id = create_document("contactmessage", doc)
+    res_id = await create_document("contactmessage", doc)
     return {"status": "ok", "id": res_id}
 
 
 # Schemas endpoint for viewers
 @app.get("/schema")
-def get_schema():
-    try:
-        from schemas import User, Blogpost, Contactmessage
-        return {
-            "user": User.model_json_schema(),
-            "blogpost": Blogpost.model_json_schema(),
-            "contactmessage": Contactmessage.model_json_schema(),
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Unable to generate schema: {str(e)}")
+async def get_schema():
+    return Response(content=SCHEMA_JSON, media_type="application/json")
 
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    workers = int(os.getenv("WEB_CONCURRENCY", (os.cpu_count() or 1) * 2 + 1))
+    # Worker processes read this to size their bcrypt pools
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        log_level="warning",
+    )
@@ -0,0 +1,72 @@
+import asyncio
+import os
+import sys
+
+import bcrypt
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import main
+
+EMAIL = "known@example.com"
+PASSWORD = "correct horse"
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def find_one(self, filter_dict):
+        for doc in self.docs:
+            if all(doc.get(k) == v for k, v in filter_dict.items()):
+                return dict(doc)
+        return None
+
+
+@pytest.fixture
+def bcrypt_calls(monkeypatch):
+    """Run bcrypt inline and count every verification the login path pays for"""
+    calls = []
+
+    async def run_inline(func, *args):
+        calls.append(func.__name__)
+        return func(*args)
+
+    user = {
+        "_id": "65f000000000000000000001",
+        "name": "Known",
+        "email": EMAIL,
+        "password_hash": bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(rounds=4)).decode(),
+    }
+    monkeypatch.setattr(database, "db", {"user": FakeCollection([user])})
+    monkeypatch.setattr(main, "run_in_bcrypt_pool", run_inline)
+    main._verify_cache.clear()
+    return calls
+
+
+def attempt_login(email, password):
+    return asyncio.run(main.login(main.LoginRequest(email=email, password=password)))
+
+
+def count_failed_attempts(calls, email, password, attempts=3):
+    before = len(calls)
+    for _ in range(attempts):
+        with pytest.raises(HTTPException) as exc:
+            attempt_login(email, password)
+        assert exc.value.status_code == 400
+    return len(calls) - before
+
+
+def test_repeated_wrong_guess_costs_the_same_for_known_and_unknown_emails(bcrypt_calls):
+    known = count_failed_attempts(bcrypt_calls, EMAIL, "wrong guess")
+    unknown = count_failed_attempts(bcrypt_calls, "missing@example.com", "wrong guess")
+    assert known == unknown == 3
+
+
+def test_repeated_correct_login_skips_bcrypt(bcrypt_calls):
+    attempt_login(EMAIL, PASSWORD)
+    attempt_login(EMAIL, PASSWORD)
+    assert bcrypt_calls == ["verify_password"]